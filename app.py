@@ -1,216 +1,287 @@
 import os
 import re
 import time
-import traceback
-import requests
-from selenium import webdriver
+import random
+import asyncio
+import threading
+import tempfile
+import logging
+import aiohttp
+import orjson
+from functools import lru_cache
+from jinja2 import Environment
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+
+from scraper_core import (
+    ANILIST_URL,
+    ANILIST_QUERY,
+    MIRURO_WATCH_BASE,
+    initialize_driver,
+    wait_for_element,
+    drain_network_log,
+    extract_video_url,
+    get_miruro_episodes,
+)
 
 # ✅ Import Telegram messaging function
-from send_mst import msg_fun, file_fun
+from send_mst import msg_fun, file_fun, flush
 
 # --------- CONSTANTS ---------
-ANILIST_URL = "https://graphql.anilist.co"
-MIRURO_WATCH_BASE = "https://www.miruro.to/watch"
+MAX_CONCURRENCY = 5  # parallel Chrome workers per extraction
+CHROME_CACHE_DIR = os.path.join(tempfile.gettempdir(), "chrome-cache")
+ANILIST_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "get_m3u", "anilist")
+ANILIST_CACHE_TTL = 7 * 24 * 3600  # 7 days
+
+logger = logging.getLogger(__name__)
+
+_MIRURO_ID_RE = re.compile(r"/watch/(\d+)", re.ASCII)
+
+# --------- THREAD-LOCAL DRIVERS ---------
+_thread_state = threading.local()
+_active_drivers = []
+_active_drivers_lock = threading.Lock()
+
+# --------- ANILIST CACHE ---------
+_anime_cache = {}
+
+def load_cached_anime(anime_id: int):
+    """Return cached AniList media from memory or disk, or None if missing/expired"""
+    if anime_id in _anime_cache:
+        return _anime_cache[anime_id]
+
+    cache_path = os.path.join(ANILIST_CACHE_DIR, f"{anime_id}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) > ANILIST_CACHE_TTL:
+            return None
+        with open(cache_path, "rb") as f:
+            media = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+    _anime_cache[anime_id] = media
+    return media
+
+def store_cached_anime(anime_id: int, media: dict):
+    """Remember AniList media in memory and persist it to disk"""
+    _anime_cache[anime_id] = media
+    try:
+        os.makedirs(ANILIST_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(ANILIST_CACHE_DIR, f"{anime_id}.json"), "wb") as f:
+            f.write(orjson.dumps(media))
+    except OSError as e:
+        logger.warning("Could not write AniList cache: %s", e)
 
 # --------- GRAPHQL FETCH ---------
-def fetch_anime_details(anime_id: int):
+async def fetch_anime_details(session: aiohttp.ClientSession, anime_id: int):
     """Fetch anime details (title, desc, cover, etc.) from AniList GraphQL API"""
-    query = """
-    query ($id: Int) {
-      Media(id: $id, type: ANIME) {
-        id
-        title {
-          romaji
-          english
-          native
-        }
-        episodes
-        coverImage {
-          extraLarge
-        }
-        averageScore
-      }
-    }
-    """
+    cached = load_cached_anime(anime_id)
+    if cached:
+        logger.info("Using cached AniList data for %d.", anime_id)
+        return cached
+
     variables = {"id": anime_id}
+    payload = orjson.dumps({"query": ANILIST_QUERY, "variables": variables})
     try:
-        response = requests.post(ANILIST_URL, json={"query": query, "variables": variables})
-        response.raise_for_status()
-        data = response.json()
-        return data.get("data", {}).get("Media", None)
+        async with session.post(ANILIST_URL, data=payload, headers={"Content-Type": "application/json"}) as response:
+            response.raise_for_status()
+            data = orjson.loads(await response.read())
+        # Shape is fixed by the query; a malformed reply lands in the except below
+        media = data["data"]["Media"]
+        if media:
+            store_cached_anime(anime_id, media)
+        return media
     except Exception as e:
         msg_fun(f"❌ AniList fetch failed: {e}")
-        print(f"[ERROR] Failed to fetch AniList data: {e}")
+        logger.error("Failed to fetch AniList data: %s", e)
         return None
 
-# --------- SELENIUM DRIVER SETUP ---------
-def initialize_driver():
-    """Initialize headless Chrome WebDriver"""
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--mute-audio")
-
-    service = Service("chromedriver")
-    driver = webdriver.Chrome(service=service, options=options)
-    return driver
-
-# --------- VIDEO URL EXTRACTION ---------
-def extract_video_url(driver, max_presses=25):
-    """Try pressing 'K' key to start video and extract m3u8/mp4 URL"""
-    actions = ActionChains(driver)
-    body = driver.find_element(By.TAG_NAME, "body")
-    pattern_m3u8 = re.compile(r'https?://[^\s"\'<>]+\.m3u8')
-    pattern_mp4 = re.compile(r'https?://[^\s"\'<>]+\.mp4')
-
-    for i in range(max_presses):
-        try:
-            actions.move_to_element(body).click().send_keys("k").perform()
-        except Exception:
-            pass
-        time.sleep(1.2)
-        html = driver.page_source
-
-        m3u8_match = pattern_m3u8.search(html)
-        mp4_match = pattern_mp4.search(html)
-
-        if m3u8_match or mp4_match:
-            return m3u8_match.group(0) if m3u8_match else mp4_match.group(0)
-    return None
-
 # --------- MIRURO EPISODE DETECTION ---------
-def get_miruro_episode_count(driver, anime_id: int):
-    """Detect number of available episodes from Miruro page"""
+def detect_episodes(anime_id: int):
+    """Open a short-lived driver just to list Miruro's episode numbers"""
+    driver = initialize_driver()
     try:
-        url = f"{MIRURO_WATCH_BASE}/{anime_id}/episode-1"
-        driver.get(url)
-        time.sleep(2)
-        ep_buttons = driver.find_elements(By.CSS_SELECTOR, "#episodes-list-container button")
-        if ep_buttons:
-            print(f"[INFO] Found {len(ep_buttons)} episodes on Miruro.")
-            # Print available episode titles
-            for i, btn in enumerate(ep_buttons, start=1):
-                title = btn.get_attribute("title") or "Untitled"
-                print(f"  • {i}. {title}")
-            return len(ep_buttons)
-        else:
-            print("[WARN] Could not detect episodes on Miruro.")
-            return 0
-    except Exception as e:
-        print(f"[WARN] Episode detection failed: {e}")
-        return 0
+        return get_miruro_episodes(driver, anime_id)
+    finally:
+        driver.quit()
 
 # --------- HTML RENDER FUNCTION ---------
-def render_html_template(template_path, output_path, anime, episodes):
-    """Render the HTML template with anime data and episode links."""
-    try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            html = f.read()
-
-        html = html.replace("{{ title }}", anime["title"].get("romaji") or "Untitled")
-        html = html.replace("{{ cover_url }}", anime["coverImage"]["extraLarge"])
-        html = html.replace("{{ score }}", str(anime.get("averageScore", "N/A")))
-        html = html.replace("{{ total_eps }}", str(len(episodes)))
+# Autoescaping covers titles/URLs that contain &, quotes or angle brackets
+_jinja_env = Environment(autoescape=True)
 
-        # Build episode links HTML
-        episode_html = ""
-        for ep in episodes:
-            episode_html += f'<a href="{ep["url"]}" class="btn btn-outline-primary episode-btn" target="_blank">Episode {ep["episode"]}</a>\n'
+@lru_cache(maxsize=1)
+def load_template(template_path: str, mtime: float):
+    """Compile the report template once; mtime in the key recompiles it after edits"""
+    with open(template_path, "r", encoding="utf-8") as f:
+        return _jinja_env.from_string(f.read())
 
-        # Replace episode loop block
-        html = re.sub(r"{% for ep in episodes %}.*?{% endfor %}", episode_html.strip(), html, flags=re.DOTALL)
+def render_html_template(template_path, output_path, anime, ep_nums, ep_urls):
+    """Render the HTML template with anime data and episode links (parallel number/URL lists)."""
+    try:
+        template = load_template(template_path, os.path.getmtime(template_path))
+        html = template.render(
+            title=anime["title"].get("romaji") or "Untitled",
+            cover_url=anime["coverImage"]["extraLarge"],
+            score=anime.get("averageScore", "N/A"),
+            total_eps=len(ep_nums),
+            episodes=zip(ep_nums, ep_urls),
+        )
 
         with open(output_path, "w", encoding="utf-8") as f:
             f.write(html)
 
     except Exception as e:
-        print(f"[ERROR] HTML render failed: {e}")
+        logger.error("HTML render failed: %s", e)
         msg_fun(f"❌ HTML render failed: {e}")
 
+# --------- PER-WORKER DRIVER ---------
+def get_thread_driver():
+    """Return the Chrome driver owned by the current worker thread, creating it on first use"""
+    driver = getattr(_thread_state, "driver", None)
+    if driver is None:
+        # Chrome locks its cache dir, so every worker thread gets its own
+        cache_dir = os.path.join(CHROME_CACHE_DIR, threading.current_thread().name)
+        driver = initialize_driver(cache_dir)
+        _thread_state.driver = driver
+        with _active_drivers_lock:
+            _active_drivers.append(driver)
+    return driver
+
+def quit_thread_drivers():
+    """Quit every driver created by the worker threads"""
+    with _active_drivers_lock:
+        drivers = list(_active_drivers)
+        _active_drivers.clear()
+    for driver in drivers:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+# --------- SINGLE EPISODE ---------
+def scrape_episode(ep: int, watch_url: str, total_eps: int):
+    """Load one episode page on this thread's driver; returns (ep, url or None)"""
+    logger.info("Loading Episode %d: %s", ep, watch_url)
+    msg_fun(f"▶️ Ep {ep}/{total_eps} → {watch_url}")
+
+    try:
+        driver = get_thread_driver()
+        drain_network_log(driver)
+        driver.get(watch_url)
+        wait_for_element(driver, By.TAG_NAME, "video")
+        video_url = extract_video_url(driver)
+        if video_url:
+            logger.info("Ep %d: %.70s", ep, video_url)
+            msg_fun(f"✅ Ep {ep}: {video_url}...")
+            return ep, video_url
+        logger.warning("Ep %d: No URL found", ep)
+        msg_fun(f"⚠️ Ep {ep}: No URL found")
+    except Exception as e:
+        # Full traceback only when debugging; the one-line error is enough otherwise
+        logger.error("Ep %d failed: %.100s", ep, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        msg_fun(f"❌ Ep {ep} failed: {str(e)[:100]}")
+    return ep, None
+
 # --------- MAIN EXTRACTION ---------
-def extract_miruro_links(anime_id: int):
+async def extract_miruro_links(session: aiohttp.ClientSession, anime_id: int, max_concurrency: int = MAX_CONCURRENCY):
     """Extract streaming URLs for all episodes of a Miruro anime"""
-    anime = fetch_anime_details(anime_id)
+    loop = asyncio.get_running_loop()
+
+    # ✅ AniList fetch and Miruro episode detection run concurrently
+    anime, miruro_episodes = await asyncio.gather(
+        fetch_anime_details(session, anime_id),
+        loop.run_in_executor(None, detect_episodes, anime_id),
+    )
     if not anime:
         msg_fun("❌ Could not fetch anime details.")
-        print("[ERROR] Could not fetch anime details from AniList.")
+        logger.error("Could not fetch anime details from AniList.")
         return
 
     title = anime["title"].get("romaji") or anime["title"].get("english") or f"Anime {anime_id}"
     total_eps_anilist = anime.get("episodes", 12)
     total_eps_anilist = min(total_eps_anilist, 25)  # avoid long runs
 
-    driver = initialize_driver()
-
-    # ✅ Detect real episode count from Miruro
-    total_eps_miruro = get_miruro_episode_count(driver, anime_id)
-    if total_eps_miruro == 0:
-        print("[WARN] Falling back to AniList episode count.")
-        total_eps_miruro = total_eps_anilist
-
-    # ✅ Use the smaller of both to prevent overfetch
-    total_eps = min(total_eps_anilist, total_eps_miruro)
-
-    start_msg = f"🎬 Starting extraction for {title} ({total_eps} episodes detected)"
-    print(start_msg)
-    msg_fun(start_msg)
-
-    results = []
-
-    for ep in range(1, total_eps + 1):
-        watch_url = f"{MIRURO_WATCH_BASE}/{anime_id}/episode-{ep}"
-        short_msg = f"▶️ Ep {ep}/{total_eps} → {watch_url}"
-        print(f"\n[INFO] Loading Episode {ep}: {watch_url}")
-        msg_fun(short_msg)
-
-        try:
-            driver.get(watch_url)
-            time.sleep(1)
-            video_url = extract_video_url(driver)
-            if video_url:
-                results.append({"episode": ep, "url": video_url})
-                success_msg = f"✅ Ep {ep}: {video_url}..."
-                print(success_msg)
-                msg_fun(success_msg)
-            else:
-                warn_msg = f"⚠️ Ep {ep}: No URL found"
-                print(warn_msg)
-                msg_fun(warn_msg)
-        except Exception as e:
-            err_msg = f"❌ Ep {ep} failed: {str(e)[:100]}"
-            print(err_msg)
-            msg_fun(err_msg)
-            traceback.print_exc()
-
-        time.sleep(1.5)
-
-    driver.quit()
+    if not miruro_episodes:
+        logger.warning("Falling back to AniList episode count.")
+        miruro_episodes = list(range(1, total_eps_anilist + 1))
+
+    # ✅ Use the smaller of both to prevent overfetch; Miruro's list gives the real numbers
+    episodes = miruro_episodes[:total_eps_anilist]
+    total_eps = len(episodes)
+
+    logger.info("Starting extraction for %s (%d episodes detected)", title, total_eps)
+    msg_fun(f"🎬 Starting extraction for {title} ({total_eps} episodes detected)")
+
+    ep_nums = []
+    ep_urls = []
+    txt_filename = f"miruro_{anime_id}.txt"
+
+    # ✅ Each worker thread owns one Chrome; the semaphore keeps at most
+    # max_concurrency episodes in flight so pending work stays in the event loop
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # ✅ Line-buffered so every found URL is on disk even if the run dies midway
+    txt_file = open(txt_filename, "w", encoding="utf-8", buffering=1)
+
+    async def run_episode(position: int, ep: int, watch_url: str):
+        if position < max_concurrency:
+            # Stagger the first wave of worker starts for politeness
+            await asyncio.sleep(position * random.uniform(0.1, 0.3))
+        async with semaphore:
+            ep, video_url = await loop.run_in_executor(executor, scrape_episode, ep, watch_url, total_eps)
+        if video_url:
+            ep_nums.append(ep)
+            ep_urls.append(video_url)
+            txt_file.write(f"Episode {ep}: {video_url}\n")
+
+    # ✅ Work list is built up front, outside the per-episode hot path
+    watch_urls = [f"{MIRURO_WATCH_BASE}/{anime_id}/episode-{ep}" for ep in episodes]
+    try:
+        await asyncio.gather(*(
+            run_episode(position, ep, url)
+            for position, (ep, url) in enumerate(zip(episodes, watch_urls))
+        ))
+    finally:
+        txt_file.close()
+        executor.shutdown(wait=True)
+        quit_thread_drivers()
+
+    # Workers finish out of order; restore episode order across both lists
+    order = sorted(range(len(ep_nums)), key=ep_nums.__getitem__)
+    ep_nums = [ep_nums[i] for i in order]
+    ep_urls = [ep_urls[i] for i in order]
+
+    # ✅ The streamed file is in completion order; rewrite it sorted in one batched write
+    with open(txt_filename, "w", encoding="utf-8", buffering=65536) as f:
+        f.writelines(f"Episode {num}: {url}\n" for num, url in zip(ep_nums, ep_urls))
 
     # --------- SAVE RESULTS (NEW HTML TEMPLATE LOGIC ADDED) ---------
-    print("\n=== Extraction Completed ===")
-    done_msg = f"✅ Extraction completed for {title}. Total: {len(results)} URLs"
-    print(done_msg)
-    msg_fun(done_msg)
+    logger.info("Extraction completed for %s. Total: %d URLs", title, len(ep_urls))
+    msg_fun(f"✅ Extraction completed for {title}. Total: {len(ep_urls)} URLs")
+    logger.info("Episode URLs saved: %s", txt_filename)
 
     # ✅ Generate HTML Report
     html_filename = f"miruro_{anime_id}.html"
-    render_html_template("template.html", html_filename, anime, results)
+    render_html_template("template.html", html_filename, anime, ep_nums, ep_urls)
 
-    print(f"\n📁 HTML Report generated: {html_filename}")
+    logger.info("HTML Report generated: %s", html_filename)
     msg_fun(f"📁 HTML Report generated: {html_filename}")
 
-    # ✅ Send HTML file to Telegram
+    # ✅ Send HTML file to Telegram (queued behind the messages above)
     file_fun(html_filename, "HTML Report")
 
+async def main(anime_id: int):
+    """Run one extraction with a single aiohttp ClientSession shared across the program"""
+    try:
+        async with aiohttp.ClientSession() as session:
+            await extract_miruro_links(session, anime_id)
+    finally:
+        flush()
+
 # --------- ENTRY POINT ---------
 if __name__ == "__main__":
+    # One console handler for this script and scraper_core; LOG_LEVEL=DEBUG adds tracebacks
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="[%(levelname)s] %(message)s")
     user_input = os.getenv("ANIME_ID", "").strip()
 
     if not user_input:
@@ -218,14 +289,15 @@ if __name__ == "__main__":
 
     # Extract ID from Miruro URL if necessary
     if "miruro.to" in user_input:
-        match = re.search(r"/watch/(\d+)", user_input)
+        match = _MIRURO_ID_RE.search(user_input)
         if match:
             anime_id = int(match.group(1))
         else:
             msg_fun("❌ Invalid Miruro URL format.")
-            print("❌ Invalid Miruro URL format.")
+            logger.error("Invalid Miruro URL format.")
+            flush()
             exit(1)
     else:
         anime_id = int(user_input)
 
-    extract_miruro_links(anime_id)
+    asyncio.run(main(anime_id))
@@ -0,0 +1,29 @@
+import os
+
+# --------- SERVER ---------
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+# Jobs, locks and caches live in each worker's memory unless REDIS_URL shares them,
+# so more than one worker needs Redis or /status polls land on workers that never saw the job
+workers = int(os.getenv("WEB_CONCURRENCY", 2 if os.getenv("REDIS_URL") else 1))
+if workers > 1 and not os.getenv("REDIS_URL"):
+    raise RuntimeError(f"workers={workers} requires REDIS_URL; set it or run with WEB_CONCURRENCY=1")
+# Threaded workers: extractions run on executor threads that drive Chrome,
+# which do not mix with gevent monkey-patching
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = 650  # MAX_RUNTIME_SECONDS plus headroom for driver teardown
+# Each worker imports index.py itself, so its job and driver pools belong to that process
+preload_app = False
+
+# --------- LOGGING ---------
+# The master owns the log file; workers' stderr (where index.py logs) is redirected into it.
+# Rotate externally and send the master USR1 to reopen it
+errorlog = os.getenv("LOG_FILE", "server.log")
+capture_output = True
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+# --------- HOOKS ---------
+def post_worker_init(worker):
+    # Warm this worker's Chrome pool in the background, after the fork
+    from index import warm_driver_pool
+    warm_driver_pool()
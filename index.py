@@ -1,25 +1,43 @@
 import os
 import re
+import sys
 import time
-import tempfile
-import traceback
-import shutil
+import atexit
 import logging
+import redis
+import orjson
 import requests
-from threading import Lock
+from uuid import uuid4
+from threading import Barrier, BrokenBarrierError, Lock, local
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from cachetools.func import ttl_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from flask import Flask, request, jsonify
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from flask.json.provider import JSONProvider
 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+
+from scraper_core import (
+    ANILIST_URL,
+    MEDIA_FRAGMENT,
+    MIRURO_ORIGIN,
+    MIRURO_WATCH_BASE,
+    initialize_driver,
+    wait_for_element,
+    drain_network_log,
+    extract_video_url,
+    get_miruro_episodes,
+)
+
 # --------- CPU LIMIT (Linux only) ---------
 # Limit this process to use only CPU 0 and 1 (adjust as needed)
 try:
@@ -28,175 +46,378 @@ except AttributeError:
     pass  # Not Linux, skip
 
 # --------- CONSTANTS ---------
-ANILIST_URL = "https://graphql.anilist.co"
-MIRURO_WATCH_BASE = "https://www.miruro.to/watch"
 MAX_RUNTIME_SECONDS = 600  # 10 minutes max per request
+# The runtime check only runs before each episode, so a run can overshoot by one episode
+LOCK_TIMEOUT_SECONDS = MAX_RUNTIME_SECONDS + 120
+REDIS_URL = os.getenv("REDIS_URL")  # shared state across gunicorn workers when set
+SERVER_STREAM_WAIT_SECONDS = 8  # the CDP log surfaces the manifest within a few seconds of play
+PLAYER_READY_TIMEOUT = 8  # max wait for the <video> element after an eager get()
+MIRURO_ID_RE = re.compile(r"/watch/(\d+)")
+ID_RE = re.compile(r"\A\d{1,9}\Z", re.ASCII)  # plain ASCII digits only; int() would also take signs/whitespace
+EPISODE_LIST_TIMEOUT = 5  # max wait for the Miruro episode list
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 2))  # extractions running at once per process
+JOB_TTL_SECONDS = 3600  # how long a finished job's result stays fetchable
+RESULT_CACHE_TTL = 3600  # stream URLs are reused for an hour before re-extracting
+
+# --------- HTTP SESSION ---------
+# Shared keep-alive session: AniList calls after the first reuse the TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": "get_m3u/1.0", "Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # The AniList query is read-only, so retrying the POST is safe
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), allowed_methods=None),
+))
 
 # --------- FLASK APP & RATE LIMITER ---------
+class OrjsonProvider(JSONProvider):
+    # jsonify() through orjson; non-str keys cover the {anime_id: media} batch payload
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["5 per minute"]
+    default_limits=["5 per minute"],
+    # Shared counters across workers; in-memory only suits a single process
+    storage_uri=REDIS_URL or "memory://"
 )
 
 # --------- LOGGING SETUP ---------
+# One stderr handler on the root logger; werkzeug and scraper_core loggers propagate into it.
+# Under gunicorn, capture_output hands worker stderr to the master's errorlog file,
+# so every worker writes one log and rotation stays a single process's job
 logging.basicConfig(
-    filename="server.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    stream=sys.stderr,
 )
+logger = logging.getLogger(__name__)
 
 # --------- CONCURRENCY LOCK ---------
-extraction_lock = Lock()
+# Serialize extractions per anime (not globally): across workers via Redis, else per process
+_redis = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+_local_locks = defaultdict(Lock)
+_local_locks_guard = Lock()
+
+@contextmanager
+def extraction_lock(anime_id: int):
+    if _redis is None:
+        with _local_locks_guard:
+            lock = _local_locks[anime_id]
+        with lock:
+            yield
+        return
+
+    lock = _redis.lock(f"extract:{anime_id}", timeout=LOCK_TIMEOUT_SECONDS)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockNotOwnedError:
+            # Expired mid-run; keep the finished result rather than failing the job
+            logger.warning("Extraction lock for anime %d expired before release.", anime_id)
 
 # --------- GRAPHQL FETCH ---------
-def fetch_anime_details(anime_id: int):
-    logging.info(f"Fetching anime details for ID {anime_id} from AniList...")
-    query = """
-    query ($id: Int) {
-      Media(id: $id, type: ANIME) {
-        id
-        title {
-          romaji
-          english
-          native
-        }
-        episodes
-        coverImage {
-          extraLarge
-        }
-        averageScore
-      }
+MAX_BATCH_IDS = 50  # aliased Media roots per AniList request
+ANILIST_CACHE_TTL = 24 * 3600  # metadata barely changes; refetch once a day
+ANILIST_TIMEOUT = (5, 10)  # (connect, read) seconds so a stalled AniList never pins a worker
+
+# Extraction only reads the titles and the episode count; /details keeps the full fragment
+_EXTRACT_QUERY = """
+query ($id: Int) {
+  Media(id: $id, type: ANIME) {
+    id
+    title {
+      romaji
+      english
     }
-    """
-    variables = {"id": anime_id}
+    episodes
+  }
+}
+"""
+
+@ttl_cache(maxsize=4096, ttl=ANILIST_CACHE_TTL)
+def _query_anime_details(anime_id: int):
+    # Raises on any failure so the cache only ever keeps successful lookups
+    response = _SESSION.post(ANILIST_URL, json={"query": _EXTRACT_QUERY, "variables": {"id": anime_id}}, timeout=ANILIST_TIMEOUT)
+    response.raise_for_status()
+    # Shape is fixed by the query; a malformed reply raises and is kept out of the cache
+    media = orjson.loads(response.content)["data"]["Media"]
+    if not media:
+        raise ValueError("AniList returned no Media")
+    return media
+
+def fetch_anime_details(anime_id: int):
+    logger.info("Fetching anime details for ID %d from AniList...", anime_id)
     try:
-        response = requests.post(ANILIST_URL, json={"query": query, "variables": variables}, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        logging.info(f"AniList data fetched successfully for ID {anime_id}.")
-        return data.get("data", {}).get("Media", None)
+        media = _query_anime_details(anime_id)
+        logger.info("AniList data fetched successfully for ID %d.", anime_id)
+        return media
     except Exception as e:
-        logging.error(f"AniList fetch failed for ID {anime_id}: {e}")
+        logger.error("AniList fetch failed for ID %d: %s", anime_id, e)
         return None
 
-# --------- SELENIUM DRIVER SETUP ---------
-def initialize_driver():
-    logging.info("Initializing headless Chrome WebDriver...")
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--mute-audio")
-    temp_dir = tempfile.mkdtemp()
-    options.add_argument(f"--user-data-dir={temp_dir}")
-
-    service = Service("chromedriver")
-    driver = webdriver.Chrome(service=service, options=options)
-    logging.info("Chrome WebDriver initialized.")
-    return driver, temp_dir
-
-# --------- VIDEO URL EXTRACTION ---------
-def extract_video_url(driver, max_attempts=25):
-    logging.info("Extracting video URL...")
-    actions = ActionChains(driver)
-    body = driver.find_element(By.TAG_NAME, "body")
-    pattern_m3u8 = re.compile(r'https?://[^\s"\'<>]+\.m3u8')
-    pattern_mp4 = re.compile(r'https?://[^\s"\'<>]+\.mp4')
-
-    for _ in range(max_attempts):
+def fetch_anime_details_batch(ids: list[int]):
+    # One GraphQL request with an aliased Media root per ID: a0, a1, ...
+    ids = list(dict.fromkeys(ids))
+    logger.info("Fetching anime details for %d IDs from AniList in one request...", len(ids))
+    var_defs = ", ".join(f"$i{n}: Int" for n in range(len(ids)))
+    roots = "\n  ".join(f"a{n}: Media(id: $i{n}, type: ANIME) {{ ...mediaFields }}" for n in range(len(ids)))
+    query = f"query ({var_defs}) {{\n  {roots}\n}}\n" + MEDIA_FRAGMENT
+    variables = {f"i{n}": anime_id for n, anime_id in enumerate(ids)}
+    # Returns None when AniList gave no answer (network error, 429, 5xx) so callers can tell
+    # an outage apart from IDs that simply don't exist
+    try:
+        response = _SESSION.post(ANILIST_URL, json={"query": query, "variables": variables}, timeout=ANILIST_TIMEOUT)
+        # AniList answers 404 when any ID is unknown but still returns the others under "data"
+        data = orjson.loads(response.content).get("data")
+    except Exception as e:
+        logger.error("AniList batch fetch failed: %s", e)
+        return None
+    if not data:
+        logger.error("AniList batch fetch returned no data (HTTP %d)", response.status_code)
+        return None
+    return {anime_id: data.get(f"a{n}") for n, anime_id in enumerate(ids)}
+
+# --------- PER-THREAD DRIVERS ---------
+# A long-lived pool whose threads each own one Chrome, started lazily on first use
+# so the gunicorn master never launches a browser
+DRIVER_WORKERS = min(os.cpu_count() or 1, 2)
+EPISODE_POOL = ThreadPoolExecutor(max_workers=DRIVER_WORKERS, thread_name_prefix="driver")
+_thread_state = local()
+_thread_drivers = []
+_thread_drivers_lock = Lock()
+
+def get_thread_driver():
+    driver = getattr(_thread_state, "driver", None)
+    if driver is None:
+        driver = initialize_driver()
+        _thread_state.driver = driver
+        with _thread_drivers_lock:
+            _thread_drivers.append(driver)
+    return driver
+
+def reset_driver(driver):
+    # Wipe the previous run's cookies, cache and storage so each extraction starts clean
+    driver.delete_all_cookies()
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+    driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": MIRURO_ORIGIN, "storageTypes": "all"})
+
+def get_run_driver(run_id: str):
+    # This thread's driver, reset the first time it serves a given extraction run
+    driver = get_thread_driver()
+    if getattr(_thread_state, "run_id", None) != run_id:
+        reset_driver(driver)
+        _thread_state.run_id = run_id
+    return driver
+
+def warm_driver_pool():
+    # Start every pool thread's Chrome ahead of the first request. The barrier keeps each
+    # warm-up task busy until all have started, so no thread picks up two of them.
+    barrier = Barrier(DRIVER_WORKERS)
+
+    def warm():
         try:
-            actions.move_to_element(body).click().send_keys("k").perform()
-        except Exception:
+            get_thread_driver()
+        except Exception as e:
+            logger.warning("Driver warm-up failed; it will start on first use: %s", e)
+        try:
+            barrier.wait(timeout=60)
+        except BrokenBarrierError:
             pass
 
+    for _ in range(DRIVER_WORKERS):
+        EPISODE_POOL.submit(warm)
+
+def discard_thread_driver():
+    # Drop a crashed/unresponsive browser; the next task on this thread starts a fresh one
+    driver = getattr(_thread_state, "driver", None)
+    if driver is None:
+        return
+    _thread_state.driver = None
+    with _thread_drivers_lock:
+        _thread_drivers.remove(driver)
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+@atexit.register
+def shutdown_thread_drivers():
+    EPISODE_POOL.shutdown(wait=False, cancel_futures=True)
+    with _thread_drivers_lock:
+        drivers = list(_thread_drivers)
+        _thread_drivers.clear()
+    for driver in drivers:
         try:
-            html = WebDriverWait(driver, 2).until(lambda d: d.page_source)
-        except:
-            html = driver.page_source
-
-        m3u8_match = pattern_m3u8.search(html)
-        mp4_match = pattern_mp4.search(html)
-        if m3u8_match or mp4_match:
-            video_url = m3u8_match.group(0) if m3u8_match else mp4_match.group(0)
-            logging.info(f"Video URL found: {video_url}")
-            return video_url
-
-    logging.warning("No video URL found after multiple attempts.")
-    return None
+            driver.quit()
+        except Exception:
+            pass
+
+# --------- SINGLE EPISODE (BLOCKING) ---------
+def detect_episodes(anime_id: int, run_id: str):
+    try:
+        return get_miruro_episodes(get_run_driver(run_id), anime_id, EPISODE_LIST_TIMEOUT)
+    except WebDriverException as e:
+        logger.warning("Driver failed during episode detection, replacing it: %s", e)
+        discard_thread_driver()
+        return []
 
-# --------- MIRURO EPISODE DETECTION ---------
-def get_miruro_episode_count(driver, anime_id: int):
-    logging.info(f"Detecting number of episodes on Miruro for anime {anime_id}...")
+def extract_episode(anime_id: int, ep: int, run_id: str):
     try:
-        url = f"{MIRURO_WATCH_BASE}/{anime_id}/episode-1"
-        driver.get(url)
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CSS_SELECTOR, "#episodes-list-container button")))
-        ep_buttons = driver.find_elements(By.CSS_SELECTOR, "#episodes-list-container button")
-        count = len(ep_buttons) if ep_buttons else 0
-        logging.info(f"Detected {count} episodes on Miruro for anime {anime_id}.")
-        return count
+        logger.info("Loading Episode %d...", ep)
+        driver = get_run_driver(run_id)
+        watch_url = f"{MIRURO_WATCH_BASE}/{anime_id}/episode-{ep}"
+        # The driver outlives episodes and requests; start from an empty network log
+        drain_network_log(driver)
+        driver.get(watch_url)
+        wait_for_element(driver, By.TAG_NAME, "video", PLAYER_READY_TIMEOUT)
+        video_url = extract_video_url(driver, SERVER_STREAM_WAIT_SECONDS)
+        if video_url:
+            return {"episode": ep, "url": video_url}
+    except WebDriverException as e:
+        logger.error("Episode %d extraction failed, replacing driver: %s", ep, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        discard_thread_driver()
     except Exception as e:
-        logging.warning(f"Episode detection failed for anime {anime_id}: {e}")
-        return 0
+        # Full traceback only when debugging; the one-line error is enough otherwise
+        logger.error("Episode %d extraction failed: %s", ep, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+    return None
+
+# --------- EXTRACTION RESULT CACHE ---------
+# Only complete runs are kept; errors and partial (timed-out) results are retried next time
+_results = TTLCache(maxsize=128, ttl=RESULT_CACHE_TTL)
+_results_lock = Lock()
+
+def cached_result(anime_id: int):
+    with _results_lock:
+        return _results.get(anime_id)
+
+def store_result(anime_id: int, response: dict):
+    if "error" in response or "message" in response or not response["episodes"]:
+        return
+    with _results_lock:
+        _results[anime_id] = response
 
 # --------- MAIN EXTRACTION WITH MAX REQUEST TIME ---------
 def extract_miruro_links(anime_id: int):
-    with extraction_lock:  # limit concurrent extractions per process
-        logging.info(f"Starting extraction for anime ID {anime_id}...")
+    with extraction_lock(anime_id):  # one extraction per anime at a time
+        # A job queued behind a run for the same anime picks up that run's result
+        cached = cached_result(anime_id)
+        if cached is not None:
+            logger.info("Using cached extraction for anime %d.", anime_id)
+            return cached
+
+        logger.info("Starting extraction for anime ID %d...", anime_id)
         start_time = time.time()
 
         anime = fetch_anime_details(anime_id)
         if not anime:
-            logging.error(f"Could not fetch anime details for ID {anime_id}.")
+            logger.error("Could not fetch anime details for ID %d.", anime_id)
             return {"error": "Could not fetch anime details"}
 
         total_eps_anilist = min(anime.get("episodes", 12), 25)
-        driver, temp_dir = initialize_driver()
-        try:
-            total_eps_miruro = get_miruro_episode_count(driver, anime_id)
-            total_eps = min(total_eps_anilist, total_eps_miruro or total_eps_anilist)
-            logging.info(f"Total episodes to extract: {total_eps}")
-
-            results = []
-            stopped_early = False
-
-            for ep in range(1, total_eps + 1):
-                elapsed = time.time() - start_time
-                if elapsed > MAX_RUNTIME_SECONDS:
-                    logging.warning("Extraction exceeded max runtime. Stopping early.")
-                    stopped_early = True
-                    break
-
-                try:
-                    logging.info(f"Loading Episode {ep}...")
-                    watch_url = f"{MIRURO_WATCH_BASE}/{anime_id}/episode-{ep}"
-                    driver.get(watch_url)
-                    WebDriverWait(driver, 5).until(lambda d: d.find_elements(By.TAG_NAME, "video") or True)
-                    video_url = extract_video_url(driver)
-                    if video_url:
-                        results.append({"episode": ep, "url": video_url})
-                except Exception as e:
-                    logging.error(f"Episode {ep} extraction failed: {e}")
-                    traceback.print_exc()
-
-            response = {
-                "anime_id": anime_id,
-                "title": anime["title"].get("romaji") or anime["title"].get("english") or f"Anime {anime_id}",
-                "episodes": results
-            }
-
-            if stopped_early:
-                response["message"] = f"Request stopped: took longer than {MAX_RUNTIME_SECONDS // 60} minutes. Partial data returned."
-
-            logging.info(f"Extraction completed for anime {anime_id}.")
-            return response
-        finally:
-            driver.quit()
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        # Runs on a pool thread so it reuses that thread's browser
+        # Every pool thread resets its browser once when it first works on this run
+        run_id = uuid4().hex
+        miruro_episodes = EPISODE_POOL.submit(detect_episodes, anime_id, run_id).result()
+        episodes = (miruro_episodes or list(range(1, total_eps_anilist + 1)))[:total_eps_anilist]
+        logger.info("Total episodes to extract: %d using %d drivers", len(episodes), DRIVER_WORKERS)
+
+        stopped_early = False
+
+        def extract_one(ep: int):
+            nonlocal stopped_early
+            if time.time() - start_time > MAX_RUNTIME_SECONDS:
+                stopped_early = True
+                return None
+            return extract_episode(anime_id, ep, run_id)
+
+        results = [r for r in EPISODE_POOL.map(extract_one, episodes) if r]
+        if stopped_early:
+            logger.warning("Extraction exceeded max runtime. Stopping early.")
+
+        response = {
+            "anime_id": anime_id,
+            "title": anime["title"].get("romaji") or anime["title"].get("english") or f"Anime {anime_id}",
+            "episodes": results
+        }
+
+        if stopped_early:
+            response["message"] = f"Request stopped: took longer than {MAX_RUNTIME_SECONDS // 60} minutes. Partial data returned."
+
+        store_result(anime_id, response)
+        logger.info("Extraction completed for anime %d.", anime_id)
+        return response
+
+# --------- BACKGROUND JOBS ---------
+# Extractions run here so the request handler returns a job id right away
+POOL = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+_jobs = TTLCache(maxsize=1024, ttl=MAX_RUNTIME_SECONDS + JOB_TTL_SECONDS)
+_jobs_lock = Lock()
+
+def _publish_job_state(job_id: str, payload: dict, ttl: int):
+    # Other gunicorn workers can't see this process's futures; share every state change via Redis
+    if _redis is None:
+        return
+    try:
+        _redis.set(f"job:{job_id}", orjson.dumps(payload), ex=ttl)
+    except redis.RedisError as e:
+        logger.warning("Could not publish job %s to Redis: %s", job_id, e)
+
+def _publish_job_result(job_id: str, future):
+    try:
+        payload = {"status": "done", "result": future.result()}
+    except Exception as e:
+        payload = {"status": "failed", "error": str(e)}
+    _publish_job_state(job_id, payload, JOB_TTL_SECONDS)
+
+def _run_job(job_id: str, anime_id: int):
+    _publish_job_state(job_id, {"status": "running"}, MAX_RUNTIME_SECONDS + JOB_TTL_SECONDS)
+    return extract_miruro_links(anime_id)
+
+def submit_extraction(anime_id: int):
+    job_id = uuid4().hex
+    # Published before submitting so the "running" update can never be overwritten by it
+    _publish_job_state(job_id, {"status": "queued"}, MAX_RUNTIME_SECONDS + JOB_TTL_SECONDS)
+    future = POOL.submit(_run_job, job_id, anime_id)
+    with _jobs_lock:
+        _jobs[job_id] = future
+    future.add_done_callback(lambda f: _publish_job_result(job_id, f))
+    logger.info("Queued extraction job %s for anime %d.", job_id, anime_id)
+    return job_id
+
+def job_status(job_id: str):
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        raw = _redis.get(f"job:{job_id}") if _redis is not None else None
+        return orjson.loads(raw) if raw else None
+    if not future.done():
+        return {"status": "running" if future.running() else "queued"}
+    try:
+        return {"status": "done", "result": future.result()}
+    except Exception as e:
+        logger.error("Extraction job %s failed: %s", job_id, e)
+        return {"status": "failed", "error": str(e)}
+
+@atexit.register
+def shutdown_job_pool():
+    POOL.shutdown(wait=False, cancel_futures=True)
 
 # --------- HOME ROUTE ---------
 @app.route("/", methods=["GET"])
@@ -207,21 +428,53 @@ def home():
         return jsonify({"message": "Welcome! Provide ?anime_id=<id> to get video URLs."}), 200
 
     if "miruro.to" in anime_input:
-        match = re.search(r"/watch/(\d+)", anime_input)
+        match = MIRURO_ID_RE.search(anime_input)
         if not match:
             return jsonify({"error": "Invalid Miruro URL format"}), 400
         anime_id = int(match.group(1))
+    elif ID_RE.match(anime_input):
+        anime_id = int(anime_input)
     else:
-        try:
-            anime_id = int(anime_input)
-        except ValueError:
-            return jsonify({"error": "Invalid AniList ID"}), 400
+        return jsonify({"error": "Invalid AniList ID"}), 400
+
+    # Repeat requests within the cache window skip the job queue entirely
+    cached = cached_result(anime_id)
+    if cached is not None:
+        return jsonify(cached)
+
+    job_id = submit_extraction(anime_id)
+    return jsonify({"job_id": job_id, "status_url": f"/status/{job_id}"}), 202
+
+# --------- JOB STATUS ROUTE ---------
+@app.route("/status/<job_id>", methods=["GET"])
+@limiter.limit("60 per minute")  # clients poll this while the extraction runs
+def status(job_id):
+    data = job_status(job_id)
+    if data is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    return jsonify({"job_id": job_id, **data})
+
+# --------- BATCH DETAILS ROUTE ---------
+@app.route("/details", methods=["GET"])
+@limiter.limit("5 per minute")
+def details():
+    raw_ids = [part.strip() for part in request.args.get("ids", "").split(",") if part.strip()]
+    if not raw_ids:
+        return jsonify({"message": "Provide ?ids=<id>,<id>,... to get AniList details."}), 200
+    if len(raw_ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"At most {MAX_BATCH_IDS} IDs per request"}), 400
+    if not all(ID_RE.match(part) for part in raw_ids):
+        return jsonify({"error": "Invalid AniList ID"}), 400
+    ids = [int(part) for part in raw_ids]
 
-    data = extract_miruro_links(anime_id)
-    return jsonify(data)
+    anime = fetch_anime_details_batch(ids)
+    if anime is None:
+        return jsonify({"error": "AniList is unavailable, try again later"}), 502
+    return jsonify({"anime": anime})
 
 # --------- ENTRY POINT ---------
+# Serve with gunicorn (see gunicorn.conf.py) rather than the single-threaded dev server
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 5000))
-    logging.info(f"Starting Flask server on port {port}...")
-    app.run(host="0.0.0.0", port=port)
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ["gunicorn", "--config", "gunicorn.conf.py", "index:app"]
+    run()
@@ -0,0 +1,357 @@
+import re
+import time
+import logging
+import re2
+import orjson
+from urllib.parse import urljoin
+from lxml import etree, html as lxml_html
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+# Shared by the CLI (app.py) and the Flask service (index.py)
+logger = logging.getLogger(__name__)
+
+# --------- CONSTANTS ---------
+ANILIST_URL = "https://graphql.anilist.co"
+MIRURO_ORIGIN = "https://www.miruro.to"
+MIRURO_WATCH_BASE = f"{MIRURO_ORIGIN}/watch"
+STREAM_WAIT_SECONDS = 30  # max wait for the stream URL after pressing K
+NETWORK_POLL_INTERVAL = 0.25  # seconds between stream probes
+PAGE_SOURCE_INTERVAL = 1.2  # min seconds between full page_source scans
+HTML_TAIL_WINDOW = 64 * 1024  # bytes of page_source scanned before a full pass
+DOM_READ_LIMIT = 200 * 1000  # max characters of outerHTML per polled DOM read
+PAGE_READY_TIMEOUT = 10  # max seconds to wait for the player/episode list
+CHROME_CACHE_SIZE = 128 * 1024 * 1024  # 128 MB per worker
+# Assets irrelevant to stream extraction; JS stays enabled for the player
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff*", "*.ttf", "*.otf", "*.css",
+    # Ad/analytics hosts; a bare "*ads*" would also catch ".../uploads/..." and "threads"
+    "*/ads/*", "*analytics*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+]
+CHROME_CONTENT_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.stylesheets": 2,
+}
+# Browser subsystems a scraper never uses (sync, updates, translate, phishing checks...);
+# trims startup time and per-driver memory. Site isolation is off so player iframes share
+# the page's renderer and their requests land in the same performance log.
+CHROME_LEAN_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-default-apps",
+    "--disable-component-update",
+    "--disable-client-side-phishing-detection",
+    "--disable-hang-monitor",
+    "--disable-prompt-on-repost",
+    "--disable-features=IsolateOrigins,site-per-process,TranslateUI",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--password-store=basic",
+]
+EPISODE_BUTTONS_CSS = "#episodes-list-container button"
+PLAYER_ERROR_CSS = ".error, .not-available"  # shown instead of a player when an episode has no source
+# Error nodes only count inside the player; toasts or comment widgets elsewhere are ignored
+PLAYER_CONTAINER_CSS = "[class*='player' i], [id*='player' i]"
+
+# --------- PRECOMPILED PATTERNS ---------
+# page_source scans use RE2: linear-time DFA, no backtracking on multi-MB pages
+_PAT_VIDEO = re2.compile(r'https?://[^\s"\'<>]+\.(m3u8|mp4)')
+_PAT_M3U8 = re2.compile(r'https?://[^\s"\'<>]+\.m3u8')
+# Per-URL check on every CDP log entry: stdlib re is cheaper than urlsplit() for short strings
+# Anchored to the path: a tracker carrying the stream URL in its query string must not match
+_PAT_STREAM_URL = re.compile(r'^[^?#]*\.(?:m3u8|mp4)(?:[?#]|$)')
+_PAT_HLS_URL = re.compile(r'^[^?#]*\.m3u8(?:[?#]|$)')
+_MEDIA_ATTR_XPATH = "//video/@src | //source/@src | //*[contains(@href, '.m3u8')]/@href"
+
+# Focus + synthetic "k" keypress in one script eval instead of click/send_keys round-trips
+_PRESS_K_JS = "document.body.focus(); document.dispatchEvent(new KeyboardEvent('keydown', {key: 'k', keyCode: 75, which: 75, bubbles: true}));"
+
+# Reads the player's src straight from the live DOM instead of serializing page_source;
+# only <video>/<source> can carry the stream, so every <script>/<img> [src] is skipped.
+# Returns false when there is no <video> and a visible error node (arguments[0]) sits inside
+# the player container (arguments[1]): nothing left to wait for.
+_MEDIA_URLS_JS = (
+    "if (!document.querySelector('video') && Array.from(document.querySelectorAll(arguments[0]))"
+    ".some(e => e.offsetParent !== null && e.closest(arguments[1]))) return false;"
+    "return Array.from(document.querySelectorAll('video, source'))"
+    ".map(e => e.src || e.currentSrc)"
+    ".filter(u => u && (u.includes('.m3u8') || u.includes('.mp4')));"
+)
+
+# Bounded DOM read: head plus the last arguments[1] chars (where the player injects its
+# source), capped at arguments[0] in total. The full length rides along for change detection.
+_BOUNDED_HTML_JS = (
+    "const h = document.documentElement.outerHTML;"
+    "return [h.length, h.length <= arguments[0] ? h"
+    " : h.slice(0, arguments[0] - arguments[1]) + h.slice(-arguments[1])];"
+)
+
+# Every episode button's [data attribute, link, text] in one script call instead of a
+# get_attribute() round-trip each
+_EPISODE_LABELS_JS = (
+    "return Array.from(document.querySelectorAll(arguments[0])).map(b => {"
+    " const a = b.closest('a[href]') || b.querySelector('a[href]');"
+    " return [b.dataset.ep || b.dataset.number || '', a ? a.getAttribute('href') : '', b.textContent || ''];"
+    "});"
+)
+_PAT_EP_ATTR = re.compile(r"^\s*(\d+)\s*$")
+_PAT_EP_HREF = re.compile(r"/episode-(\d+)(?:[/?#]|$)")
+# Text is the last resort: only a leading number (optionally after "Ep"/"Episode") counts
+_PAT_EP_TEXT = re.compile(r"^\s*(?:ep(?:isode)?\.?\s*)?(\d+)", re.IGNORECASE)
+
+# --------- ANILIST QUERY ---------
+MEDIA_FRAGMENT = """
+fragment mediaFields on Media {
+  id
+  title {
+    romaji
+    english
+  }
+  episodes
+  coverImage {
+    extraLarge
+  }
+  averageScore
+}
+"""
+
+ANILIST_QUERY = """
+query ($id: Int) {
+  Media(id: $id, type: ANIME) {
+    ...mediaFields
+  }
+}
+""" + MEDIA_FRAGMENT
+
+# --------- SELENIUM DRIVER SETUP ---------
+def initialize_driver(cache_dir: str = None):
+    """Initialize headless Chrome WebDriver, optionally with a persistent disk cache"""
+    logger.info("Initializing headless Chrome WebDriver...")
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--mute-audio")
+    for arg in CHROME_LEAN_ARGS:
+        options.add_argument(arg)
+    # Second guard next to the content prefs: the renderer never decodes images
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    # get() returns on DOMContentLoaded; callers wait explicitly for the elements they need
+    options.page_load_strategy = "eager"
+    if cache_dir:
+        # Shared player/JS assets are served from cache on episodes 2..N
+        options.add_argument(f"--disk-cache-dir={cache_dir}")
+        options.add_argument(f"--disk-cache-size={CHROME_CACHE_SIZE}")
+    options.add_experimental_option("prefs", CHROME_CONTENT_PREFS)
+    # Record CDP network events so stream requests can be read from the log
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    # Only Network events reach the log, so each get_log() read stays small
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
+    service = Service("chromedriver")
+    driver = webdriver.Chrome(service=service, options=options)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    logger.info("Chrome WebDriver initialized.")
+    return driver
+
+def wait_for_element(driver, by, value, timeout=PAGE_READY_TIMEOUT):
+    """Wait until an element is present; returns False instead of raising on timeout"""
+    try:
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((by, value)))
+        return True
+    except TimeoutException:
+        return False
+
+# --------- VIDEO URL EXTRACTION ---------
+class PlayerUnavailable(Exception):
+    """The page shows an error in place of the player; stops the stream wait early"""
+
+def is_stream_url(url: str):
+    """True when the URL path (query and fragment ignored) names an m3u8/mp4 resource"""
+    return _PAT_STREAM_URL.match(url) is not None
+
+def drain_network_log(driver):
+    """Discard buffered performance-log entries so the next page starts with an empty log"""
+    # The previous page keeps logging (HLS level playlists, the episode-1 player) until the
+    # next get(); without this a reused driver can report the last episode's stream
+    try:
+        driver.get_log("performance")
+    except Exception:
+        pass
+
+def find_stream_in_network_log(driver):
+    """Return a stream URL from the new CDP performance log entries, preferring m3u8"""
+    mp4_url = None
+    for entry in driver.get_log("performance"):
+        try:
+            message = orjson.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method = message.get("method")
+        params = message.get("params", {})
+        # requestWillBeSent fires first; responseReceived covers redirected manifests
+        if method == "Network.requestWillBeSent":
+            url = params.get("request", {}).get("url", "")
+        elif method == "Network.responseReceived":
+            url = params.get("response", {}).get("url", "")
+        else:
+            continue
+        if is_stream_url(url):
+            # Keep reading the batch: an HLS manifest beats an mp4 logged before it
+            if _PAT_HLS_URL.match(url):
+                return url
+            mp4_url = mp4_url or url
+    return mp4_url
+
+def find_stream_in_markup(html: str, base_url: str = None):
+    """Return an absolute stream URL from media/link attributes, parsed by lxml without scanning script text"""
+    try:
+        tree = lxml_html.fromstring(html)
+    except (ValueError, etree.LxmlError):
+        return None
+    for url in tree.xpath(_MEDIA_ATTR_XPATH):
+        # Attribute values may be relative; resolve them against the page, or skip them without one
+        if base_url:
+            url = urljoin(base_url, url)
+        if url.startswith(("http://", "https://")) and is_stream_url(url):
+            return url
+    return None
+
+def find_stream_in_html(html: str, base_url: str = None):
+    """Return the first m3u8/mp4 URL embedded in page HTML, preferring m3u8"""
+    video_url = find_stream_in_markup(html, base_url)
+    if video_url:
+        return video_url
+
+    # Regex last resort for URLs hidden in inline JSON/JS.
+    # The player injects its source near the end of <body>; scan the tail first
+    if len(html) > HTML_TAIL_WINDOW:
+        video_url = _search_stream(html[-HTML_TAIL_WINDOW:])
+        if video_url:
+            return video_url
+    return _search_stream(html)
+
+def _search_stream(html: str):
+    """Single fused-pattern scan of one HTML chunk"""
+    match = _PAT_VIDEO.search(html)
+    if not match:
+        return None
+    # Prefer an HLS manifest if one appears after the first mp4 hit
+    if match.group(1) == "mp4":
+        m3u8_match = _PAT_M3U8.search(html, match.end())
+        if m3u8_match:
+            return m3u8_match.group(0)
+    return match.group(0)
+
+def extract_video_url(driver, timeout=STREAM_WAIT_SECONDS):
+    """Press 'K' once to start the video, then wait until an m3u8/mp4 URL surfaces"""
+    try:
+        driver.execute_script(_PRESS_K_JS)
+    except Exception:
+        pass
+
+    try:
+        page_url = driver.current_url  # base for relative src/href values in the markup
+    except Exception:
+        page_url = None
+    state = {"signature": None, "next_dom_scan": 0.0, "full_length": None}
+
+    def probe(d):
+        # Network log is incremental and tiny; checked on every poll
+        video_url = find_stream_in_network_log(d)
+        if video_url:
+            return video_url
+
+        # Next: media element src read in-page, a few bytes over the wire
+        try:
+            urls = d.execute_script(_MEDIA_URLS_JS, PLAYER_ERROR_CSS, PLAYER_CONTAINER_CSS)
+        except Exception:
+            urls = None
+        if urls is False:
+            raise PlayerUnavailable()
+        if urls:
+            return urls[0]
+
+        # Last resort: URL embedded in inline scripts of the serialized DOM,
+        # read size-bounded and at a slower cadence because the transfer is expensive
+        now = time.monotonic()
+        if now < state["next_dom_scan"]:
+            return None
+        state["next_dom_scan"] = now + PAGE_SOURCE_INTERVAL
+        try:
+            full_length, html = d.execute_script(_BOUNDED_HTML_JS, DOM_READ_LIMIT, HTML_TAIL_WINDOW)
+        except Exception:
+            return None
+        # Skip the scan when the page has not changed since the last one;
+        # the tail hash catches late <source src=...> tags that keep the length equal
+        state["full_length"] = full_length
+        signature = (full_length, hash(html[-4096:]))
+        if signature == state["signature"]:
+            return None
+        state["signature"] = signature
+        return find_stream_in_html(html, page_url)
+
+    try:
+        # Returns the moment the URL exists instead of sleeping a fixed interval
+        video_url = WebDriverWait(driver, timeout, poll_frequency=NETWORK_POLL_INTERVAL).until(probe)
+        logger.info("Video URL captured: %s", video_url)
+        return video_url
+    except PlayerUnavailable:
+        logger.warning("Player reports the episode as unavailable.")
+        return None
+    except TimeoutException:
+        pass
+
+    # The bounded reads skip the middle of very large pages; scan the full DOM once,
+    # unless the last bounded read already held the whole page
+    if state["full_length"] is not None and state["full_length"] <= DOM_READ_LIMIT:
+        video_url = None
+    else:
+        video_url = find_stream_in_html(driver.page_source, page_url)
+    if video_url:
+        logger.info("Video URL found in full page source: %s", video_url)
+        return video_url
+    logger.warning("No video URL found.")
+    return None
+
+# --------- MIRURO EPISODE DETECTION ---------
+def get_miruro_episodes(driver, anime_id: int, timeout=PAGE_READY_TIMEOUT):
+    """Return the episode numbers listed on the Miruro page, in page order ([] if none found)"""
+    logger.info("Detecting episodes on Miruro for anime %d...", anime_id)
+    try:
+        driver.get(f"{MIRURO_WATCH_BASE}/{anime_id}/episode-1")
+        wait_for_element(driver, By.CSS_SELECTOR, EPISODE_BUTTONS_CSS, timeout)
+        labels = driver.execute_script(_EPISODE_LABELS_JS, EPISODE_BUTTONS_CSS) or []
+    except Exception as e:
+        logger.warning("Episode detection failed for anime %d: %s", anime_id, e)
+        return []
+
+    # data-ep/data-number first, then the episode link, then the leading number of the text
+    episodes = []
+    seen = set()
+    for attr, href, text in labels:
+        match = (_PAT_EP_ATTR.match(attr or "") or _PAT_EP_HREF.search(href or "")
+                 or _PAT_EP_TEXT.match(text or ""))
+        if not match:
+            logger.warning("Unparseable episode button on anime %d: %r", anime_id, (attr, href, text.strip()[:40]))
+            continue
+        ep = int(match.group(1))
+        if ep in seen:
+            logger.warning("Duplicate episode %d on anime %d: %r", ep, anime_id, (attr, href, text.strip()[:40]))
+            continue
+        seen.add(ep)
+        episodes.append(ep)
+    logger.info("Detected %d episodes on Miruro for anime %d.", len(episodes), anime_id)
+    return episodes
@@ -1,27 +1,55 @@
 import os
+import queue
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def msg_fun(message: str):
+# (connect, read) seconds; uploads get a longer read window
+MESSAGE_TIMEOUT = (5, 10)
+UPLOAD_TIMEOUT = (5, 60)
+TELEGRAM_MAX_TEXT = 4096  # Bot API limit for one sendMessage text
+
+# One keep-alive session for every Telegram call: the TLS handshake happens once per process.
+# Retry's defaults leave POST alone, so a document is never uploaded twice.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)),
+))
+
+# --------- CREDENTIALS ---------
+# KEYS is read and split once at import; the send functions raise if it is missing or malformed
+KEYS = os.getenv("KEYS")
+try:
+    BOT_TOKEN, CHAT_ID = KEYS.split("_", 1) if KEYS else (None, None)
+except ValueError:
+    BOT_TOKEN = CHAT_ID = None
+
+def _require_keys():
+    if not KEYS:
+        raise ValueError("Environment variable 'KEYS' not found. Format: BOT_TOKEN_CHAT_ID")
+    if BOT_TOKEN is None:
+        raise ValueError("Invalid KEYS format. Use BOT_TOKEN_CHAT_ID")
+    return BOT_TOKEN, CHAT_ID
+
+def _send_sync(message: str):
     """
     Sends a text message to a Telegram bot.
     Requires environment variable KEYS in the format: BOT_TOKEN_CHAT_ID
     Example:
       KEYS="123456789:ABCDEFghIJKLmnopQRSTUvwxYZ_987654321"
     """
-    KEYS = os.getenv("KEYS")
-    if not KEYS:
-        raise ValueError("Environment variable 'KEYS' not found. Format: BOT_TOKEN_CHAT_ID")
+    bot_token, chat_id = _require_keys()
 
-    try:
-        BOT_TOKEN, CHAT_ID = KEYS.split("_", 1)
-    except ValueError:
-        raise ValueError("Invalid KEYS format. Use BOT_TOKEN_CHAT_ID")
+    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    # Form-encoded POST: the text stays out of the request line and any URL logs
+    data = {"chat_id": chat_id, "text": message}
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    params = {"chat_id": CHAT_ID, "text": message}
-
-    response = requests.get(url, params=params)
-    data = response.json()
+    response = _session.post(url, data=data, timeout=MESSAGE_TIMEOUT)
+    data = orjson.loads(response.content)
 
     if not data.get("ok"):
         print("❌ Failed to send message:", data)
@@ -30,33 +58,81 @@ def msg_fun(message: str):
     return data
 
 
-def file_fun(file_path: str, caption: str = ""):
+def _send_file_sync(file_path: str, caption: str = ""):
     """
     Sends a file (like .txt or .html) to a Telegram chat.
-    Uses same KEYS environment variable as msg_fun.
+    Uses same KEYS environment variable as _send_sync.
     """
     if not os.path.exists(file_path):
         print(f"❌ File not found: {file_path}")
         return None
 
-    KEYS = os.getenv("KEYS")
-    if not KEYS:
-        raise ValueError("Environment variable 'KEYS' not found. Format: BOT_TOKEN_CHAT_ID")
-
-    try:
-        BOT_TOKEN, CHAT_ID = KEYS.split("_", 1)
-    except ValueError:
-        raise ValueError("Invalid KEYS format. Use BOT_TOKEN_CHAT_ID")
+    bot_token, chat_id = _require_keys()
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendDocument"
+    url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
     with open(file_path, "rb") as f:
         files = {"document": f}
-        data = {"chat_id": CHAT_ID, "caption": caption}
-        response = requests.post(url, files=files, data=data)
+        data = {"chat_id": chat_id, "caption": caption}
+        response = _session.post(url, files=files, data=data, timeout=UPLOAD_TIMEOUT)
 
-    result = response.json()
+    result = orjson.loads(response.content)
     if not result.get("ok"):
         print("❌ Failed to send file:", result)
     else:
         print(f"✅ File sent successfully: {file_path}")
     return result
+
+
+# --------- BACKGROUND SENDER ---------
+# Callers only enqueue; one daemon thread talks to Telegram, in submission order.
+# Items are ("text", message) or ("file", (file_path, caption)).
+_outbox = queue.Queue()
+
+def _drain_outbox():
+    carry = None
+    while True:
+        kind, payload = carry if carry is not None else _outbox.get()
+        carry = None
+        if kind == "file":
+            try:
+                _send_file_sync(*payload)
+            except Exception as e:
+                print("❌ Telegram file send failed:", e)
+            finally:
+                _outbox.task_done()
+            continue
+
+        # Join the text messages already waiting into one sendMessage
+        batch = [payload]
+        size = len(payload)
+        while True:
+            try:
+                item = _outbox.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] != "text" or size + len(item[1]) + 1 > TELEGRAM_MAX_TEXT:
+                carry = item  # starts the next round, keeping order
+                break
+            batch.append(item[1])
+            size += len(item[1]) + 1
+        try:
+            _send_sync("\n".join(batch))
+        except Exception as e:
+            print("❌ Telegram send failed:", e)
+        finally:
+            for _ in batch:
+                _outbox.task_done()
+
+threading.Thread(target=_drain_outbox, name="telegram-sender", daemon=True).start()
+
+def msg_fun(message: str):
+    """Queue a Telegram text message; returns immediately."""
+    _outbox.put_nowait(("text", message))
+
+def file_fun(file_path: str, caption: str = ""):
+    """Queue a file for Telegram; it is sent after every message queued before it."""
+    _outbox.put_nowait(("file", (file_path, caption)))
+
+def flush():
+    """Block until everything queued so far has been sent."""
+    _outbox.join()